@@ -2,8 +2,12 @@ import sys
 
 import pygame
 
-from scripts.utils import load_images
-from scripts.tilemap import Tilemap
+from scripts.assets import load_editor_assets
+from scripts.atlas import Atlas
+from scripts.mapfile import map_path
+from scripts.tilemap import Tile, Tilemap
+from scripts.presenter import Presenter
+from scripts.utils import line_cells
 
 RENDER_SCALE = 1.0
 
@@ -17,36 +21,17 @@ class Editor:
         self.display = pygame.Surface((1920, 1080))
 
         self.clock = pygame.time.Clock()
+        self.presenter = Presenter(self.screen)
 
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'egypt_wood': load_images('tiles/egypt_wood'),
-            'egypt_border': load_images('tiles/egypt_border'),
-            'egypt_platform': load_images('tiles/editor_platform'),
-            'platform_dest': load_images('tiles/dest/'),
-            'stone_border': load_images('tiles/stone_border'),
-            'brick': load_images('tiles/brick'),
-            'spawners': load_images('tiles/spawners'),
-            'traps': load_images('tiles/traps'),
-            'arrow_spawner': load_images('tiles/arrow_spawner'),
-            'arrow': load_images('tiles/arrows'),
-            'barrier': load_images('tiles/barrier'),
-            'platform': load_images('tiles/platforms'),
-            'button': load_images('tiles/buttons'),
-            'lever': load_images('tiles/levers'),
-            'chest': load_images('tiles/chest'),
-            'door': load_images('tiles/doors'),
-            'key': load_images('tiles/key'),
-            'torch': load_images('tiles/torch_editor'),
-            'text': load_images('tiles/text'),
-        }
+        self.assets = load_editor_assets()
+        self.atlas = Atlas(self.assets)
 
         self.movement = [False, False, False, False]
 
         self.tilemap = Tilemap(self, tile_size=64)
 
         try:
-            self.tilemap.load('map.json')
+            self.tilemap.load(map_path('map'))
         except FileNotFoundError:
             pass
 
@@ -61,6 +46,20 @@ class Editor:
         self.shift = False
         self.ongrid = True
         self.layout = True
+        self.autotiling = False
+
+        # A stroke remembers the last cell it reached so the next frame fills in every cell the mouse passed over
+        self.paint_from = None
+        self.erase_from = None
+        self.ghosts = {}
+
+    def ghost_image(self):
+        key = (self.tile_group, self.tile_variant)
+        if key not in self.ghosts:
+            img = self.assets[self.tile_list[self.tile_group]][self.tile_variant].copy()
+            img.set_alpha(100)
+            self.ghosts[key] = img
+        return self.ghosts[key]
 
     def run(self):
 
@@ -73,8 +72,7 @@ class Editor:
 
             self.tilemap.render(self.display, offset=render_scroll)
 
-            current_tile_img = self.assets[self.tile_list[self.tile_group]][self.tile_variant].copy()
-            current_tile_img.set_alpha(100)
+            current_tile_img = self.ghost_image()
 
             mpos = pygame.mouse.get_pos()
             mpos = (mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE)
@@ -88,18 +86,28 @@ class Editor:
                 self.display.blit(current_tile_img, mpos)
 
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = \
-                    {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
+                tile_type = self.tile_list[self.tile_group]
+                cells = line_cells(tile_pos if self.paint_from is None else self.paint_from, tile_pos)
+                self.paint_from = tile_pos
+                if self.autotiling:
+                    # With live autotiling the painted variant is replaced, so only a change of type repaints a cell
+                    cells = [loc for loc in cells
+                             if loc not in self.tilemap.tilemap or self.tilemap.tilemap[loc].type != tile_type]
+                for loc in self.tilemap.paint(cells, tile_type, self.tile_variant):
+                    if self.autotiling:
+                        self.tilemap.autotile_at(loc)
+            else:
+                self.paint_from = None
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1],
-                                         tile_img.get_width(), tile_img.get_height())
-                    if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                cells = line_cells(tile_pos if self.erase_from is None else self.erase_from, tile_pos)
+                self.erase_from = tile_pos
+                for loc in self.tilemap.erase(cells):
+                    if self.autotiling:
+                        self.tilemap.autotile_at(loc)
+                for tile in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
+                    self.tilemap.remove_offgrid(tile)
+            else:
+                self.erase_from = None
 
             self.display.blit(current_tile_img, (5, 5))
 
@@ -111,10 +119,8 @@ class Editor:
                     if event.button == 1:
                         self.clicking = True
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group],
-                                                               'variant': self.tile_variant,
-                                                               'pos': (mpos[0] + self.scroll[0],
-                                                                       mpos[1] + self.scroll[1])})
+                            self.tilemap.add_offgrid(Tile(self.tile_list[self.tile_group], self.tile_variant,
+                                                          (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])))
                     if event.button == 3:
                         self.right_clicking = True
                     if self.shift:
@@ -159,10 +165,13 @@ class Editor:
                         self.ongrid = not self.ongrid
                     if event.key == pygame.K_t:
                         self.tilemap.autotile()
+                    if event.key == pygame.K_y:
+                        self.autotiling = not self.autotiling
                     if event.key == pygame.K_l:
                         self.layout = not self.layout
                     if event.key == pygame.K_o:
                         self.tilemap.save('map.json')
+                        self.tilemap.save('map.wwm')
                     if event.key == pygame.K_LSHIFT:
                         self.shift = True
                 if event.type == pygame.KEYUP:
@@ -187,8 +196,7 @@ class Editor:
                     if event.key == pygame.K_LSHIFT:
                         self.shift = False
 
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
+            self.presenter.present(self.display)
             self.clock.tick(60)
 
 
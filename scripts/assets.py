@@ -0,0 +1,187 @@
+import os
+import pickle
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.utils import BASE_IMG_PATH, Animation
+
+ASSET_CACHE_PATH = 'data/assets.cache'
+ASSET_CACHE_VERSION = 2
+
+
+def decode_image(path):
+    # Runs in a worker thread: only decodes the PNG, converting to the display format must happen on the main thread
+    surf = pygame.image.load(BASE_IMG_PATH + path)
+    # BGRA matches the byte order of the usual 32-bit display format, which keeps convert() cheap.
+    # Raw pixels are ~20x the size of the PNGs (mostly the full-screen backgrounds), so they are stored compressed
+    return surf.get_size(), zlib.compress(pygame.image.tobytes(surf, 'BGRA'))
+
+
+class AssetManager:
+    def __init__(self, cache_path=ASSET_CACHE_PATH):
+        self.cache_path = cache_path
+        self.cache = None
+        self.dirty = False
+        self.surfaces = {}
+        self.directories = {}
+
+    def files(self, path):
+        path = os.path.normpath(path).replace(os.sep, '/')
+        if os.path.isdir(BASE_IMG_PATH + path):
+            return [path + '/' + name for name in sorted(os.listdir(BASE_IMG_PATH + path))]
+        return [path]
+
+    def load_cache(self):
+        self.cache = {}
+        try:
+            f = open(self.cache_path, 'rb')
+            version, cache = pickle.load(f)
+            f.close()
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return
+        if version == ASSET_CACHE_VERSION:
+            self.cache = cache
+            # Drop images whose source file is gone; the next save writes the pruned cache back
+            for file in [file for file in cache if not os.path.exists(BASE_IMG_PATH + file)]:
+                del cache[file]
+                self.dirty = True
+
+    def save_cache(self):
+        try:
+            f = open(self.cache_path + '.tmp', 'wb')
+            pickle.dump((ASSET_CACHE_VERSION, self.cache), f, pickle.HIGHEST_PROTOCOL)
+            f.close()
+            os.replace(self.cache_path + '.tmp', self.cache_path)
+            self.dirty = False
+        except OSError:
+            pass
+
+    def preload(self, paths):
+        if self.cache is None:
+            self.load_cache()
+
+        stamps = {}
+        for path in paths:
+            for file in self.files(path):
+                if file not in self.surfaces:
+                    stat = os.stat(BASE_IMG_PATH + file)
+                    stamps[file] = (stat.st_mtime_ns, stat.st_size)
+
+        stale = [file for file in stamps if file not in self.cache or self.cache[file][0] != stamps[file]]
+        if stale:
+            pool = ThreadPoolExecutor()
+            for file, (size, pixels) in zip(stale, pool.map(decode_image, stale)):
+                self.cache[file] = (stamps[file], size, pixels)
+            pool.shutdown()
+            self.dirty = True
+        if self.dirty:
+            self.save_cache()
+
+        for file in stamps:
+            stamp, size, pixels = self.cache[file]
+            img = pygame.image.frombuffer(zlib.decompress(pixels), size, 'BGRA').convert()
+            img.set_colorkey((0, 0, 0))
+            self.surfaces[file] = img
+
+    def image(self, path):
+        file = self.files(path)[0]
+        if file not in self.surfaces:
+            self.preload([file])
+        return self.surfaces[file]
+
+    def images(self, path):
+        # Directories are keyed by their normalised path so the same folder is only ever loaded once
+        files = self.files(path)
+        key = tuple(files)
+        if key not in self.directories:
+            self.preload([path])
+            self.directories[key] = [self.surfaces[file] for file in files]
+        return self.directories[key]
+
+
+GAME_IMAGE_PATHS = [
+    'tiles/decor', 'tiles/egypt_wood', 'tiles/platform_dest', 'tiles/egypt_border', 'tiles/brick', 'tiles/stone_border',
+    'tiles/traps', 'tiles/barrier', 'tiles/platforms', 'tiles/buttons', 'tiles/levers', 'tiles/chest', 'tiles/doors',
+    'tiles/key', 'tiles/arrow_spawner', 'tiles/arrows', 'entities/player.png', 'tiles/torch', 'tiles/text',
+    'entities/enemy/idle', 'entities/enemy/run', 'entities/player/idle', 'entities/player/run', 'entities/player/jump',
+    'entities/player/wall_slide', 'entities/player2/idle', 'particles/particle', 'background', 'menus/bg',
+    'menus/buttons/0.png',
+]
+
+EDITOR_IMAGE_PATHS = [
+    'tiles/decor', 'tiles/egypt_wood', 'tiles/egypt_border', 'tiles/editor_platform', 'tiles/dest',
+    'tiles/stone_border', 'tiles/brick', 'tiles/spawners', 'tiles/traps', 'tiles/arrow_spawner', 'tiles/arrows',
+    'tiles/barrier', 'tiles/platforms', 'tiles/buttons', 'tiles/levers', 'tiles/chest', 'tiles/doors', 'tiles/key',
+    'tiles/torch_editor', 'tiles/text',
+]
+
+
+def load_game_assets(manager=None):
+    if manager is None:
+        manager = AssetManager()
+    manager.preload(GAME_IMAGE_PATHS)
+    load_images = manager.images
+    return {
+        'decor': load_images('tiles/decor'),
+        'egypt_wood': load_images('tiles/egypt_wood'),
+        'egypt_platform': load_images('tiles/egypt_wood'),
+        'platform_dest': load_images('tiles/platform_dest'),
+        'egypt_border': load_images('tiles/egypt_border'),
+        'brick': load_images('tiles/brick'),
+        'stone_border': load_images('tiles/stone_border'),
+        'traps': load_images('tiles/traps'),
+        'barrier': load_images('tiles/barrier'),
+        'platform': load_images('tiles/platforms'),
+        'button': load_images('tiles/buttons'),
+        'lever': load_images('tiles/levers'),
+        'chest': load_images('tiles/chest'),
+        'door': load_images('tiles/doors'),
+        'key': load_images('tiles/key'),
+        'arrow_spawner': load_images('tiles/arrow_spawner'),
+        'arrow': load_images('tiles/arrows'),
+        'player': manager.image('entities/player.png'),
+        'torch': load_images('tiles/torch'),
+        'text': load_images('tiles/text'),
+        'enemy/idle': Animation(load_images('entities/enemy/idle'), img_dur=6),
+        'enemy/run': Animation(load_images('entities/enemy/run'), img_dur=4),
+        'player/idle': Animation(load_images('entities/player/idle'), img_dur=6),
+        'player/run': Animation(load_images('entities/player/run'), img_dur=4),
+        'player/jump': Animation(load_images('entities/player/jump')),
+        'player/wall_slide': Animation(load_images('entities/player/wall_slide')),
+        'player2/idle': Animation(load_images('entities/player2/idle'), img_dur=6),
+        'particle/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
+        'background': load_images('background'),
+        'menu': load_images('menus/bg'),
+        'menu_button': manager.image('menus/buttons/0.png'),
+    }
+
+
+def load_editor_assets(manager=None):
+    if manager is None:
+        manager = AssetManager()
+    manager.preload(EDITOR_IMAGE_PATHS)
+    load_images = manager.images
+    return {
+        'decor': load_images('tiles/decor'),
+        'egypt_wood': load_images('tiles/egypt_wood'),
+        'egypt_border': load_images('tiles/egypt_border'),
+        'egypt_platform': load_images('tiles/editor_platform'),
+        'platform_dest': load_images('tiles/dest/'),
+        'stone_border': load_images('tiles/stone_border'),
+        'brick': load_images('tiles/brick'),
+        'spawners': load_images('tiles/spawners'),
+        'traps': load_images('tiles/traps'),
+        'arrow_spawner': load_images('tiles/arrow_spawner'),
+        'arrow': load_images('tiles/arrows'),
+        'barrier': load_images('tiles/barrier'),
+        'platform': load_images('tiles/platforms'),
+        'button': load_images('tiles/buttons'),
+        'lever': load_images('tiles/levers'),
+        'chest': load_images('tiles/chest'),
+        'door': load_images('tiles/doors'),
+        'key': load_images('tiles/key'),
+        'torch': load_images('tiles/torch_editor'),
+        'text': load_images('tiles/text'),
+    }
@@ -0,0 +1,63 @@
+import pygame
+
+from scripts.utils import Animation
+
+ATLAS_SIZE = 1024
+
+
+class Atlas:
+    # Packs every asset image that fits into a few large sheets; regions maps each image to (sheet, subrect)
+    def __init__(self, assets, size=ATLAS_SIZE):
+        self.size = size
+        self.sheets = []
+        self.regions = {}
+
+        images = []
+        for asset in assets.values():
+            if isinstance(asset, Animation):
+                images.extend(asset.images + asset.flipped_images)
+            elif isinstance(asset, list):
+                images.extend(asset)
+            else:
+                images.append(asset)
+        unique = {}
+        for img in images:
+            if img.get_width() <= size and img.get_height() <= size:
+                unique[img] = True
+        self.pack(sorted(unique, key=lambda img: (-img.get_height(), -img.get_width())))
+
+    def pack(self, images):
+        # Shelf packing: images go left to right in rows as tall as the first (tallest) image of the row
+        placements = []
+        sheet = 0
+        x = y = shelf = 0
+        heights = []
+        for img in images:
+            width, height = img.get_size()
+            if x + width > self.size:
+                x = 0
+                y += shelf
+                shelf = 0
+            if y + height > self.size:
+                heights.append(y)
+                sheet += 1
+                x = y = shelf = 0
+            placements.append((img, sheet, pygame.Rect(x, y, width, height)))
+            x += width
+            shelf = max(shelf, height)
+        heights.append(y + shelf)
+
+        for height in heights:
+            sheet_surf = pygame.Surface((self.size, max(1, height))).convert()
+            sheet_surf.fill((0, 0, 0))
+            sheet_surf.set_colorkey((0, 0, 0))
+            self.sheets.append(sheet_surf)
+        for img, sheet, rect in placements:
+            self.sheets[sheet].blit(img, rect)
+            self.regions[img] = (self.sheets[sheet], rect)
+
+    def blit_args(self, img, dest):
+        if img in self.regions:
+            sheet, rect = self.regions[img]
+            return sheet, dest, rect
+        return img, dest
@@ -1,3 +1,8 @@
+from scripts.utils import render_text
+
+BUTTON_CELL_SIZE = 128
+
+
 class Button:
     def __init__(self, image, pos, text_input, font, base_color, hovering_color):
         self.image = image
@@ -6,7 +11,9 @@ class Button:
         self.font = font
         self.base_color, self.hovering_color = base_color, hovering_color
         self.text_input = text_input
-        self.text = self.font.render(self.text_input, True, self.base_color)
+        self.base_text = render_text(self.font, self.text_input, True, self.base_color)
+        self.hovering_text = render_text(self.font, self.text_input, True, self.hovering_color)
+        self.text = self.base_text
         if self.image is None:
             self.image = self.text
         self.text_rect = self.text.get_rect(center=(self.x_pos, self.y_pos))
@@ -25,15 +32,56 @@ class Button:
             screen.blit(self.image, self.rect)
         screen.blit(self.text, self.text_rect)
 
+    def area(self):
+        # Everything update() draws to: the image is blitted at the padded rect's corner, the text at its centre
+        return self.image.get_rect(topleft=self.rect.topleft).union(self.text_rect)
+
     def check_for_input(self, position):
-        if position[0] in range(self.rect.left, self.rect.right) and position[1] in range(self.rect.top,
-                                                                                          self.rect.bottom):
-            return True
-        return False
+        return bool(self.rect.collidepoint(position))
+
+    def set_hovered(self, hovered):
+        text = self.hovering_text if hovered else self.base_text
+        changed = text is not self.text
+        self.text = text
+        return changed
 
     def change_color(self, position):
-        if position[0] in range(self.rect.left, self.rect.right) and position[1] in range(self.rect.top,
-                                                                                          self.rect.bottom):
-            self.text = self.font.render(self.text_input, True, self.hovering_color)
-        else:
-            self.text = self.font.render(self.text_input, True, self.base_color)
+        return self.set_hovered(self.check_for_input(position))
+
+
+class ButtonGroup:
+    # Buttons are indexed by the grid cells their rects cover, so a hit test only looks at the buttons in one cell
+    def __init__(self, buttons, cell_size=BUTTON_CELL_SIZE):
+        self.buttons = list(buttons)
+        self.cell_size = cell_size
+        self.cells = {}
+        self.hovered = None
+        for button in self.buttons:
+            rect = button.rect
+            for cx in range(rect.left // cell_size, (rect.right - 1) // cell_size + 1):
+                for cy in range(rect.top // cell_size, (rect.bottom - 1) // cell_size + 1):
+                    self.cells.setdefault((cx, cy), []).append(button)
+
+    def __iter__(self):
+        return iter(self.buttons)
+
+    def button_at(self, position):
+        for button in self.cells.get((position[0] // self.cell_size, position[1] // self.cell_size), ()):
+            if button.check_for_input(position):
+                return button
+        return None
+
+    def hover(self, position):
+        # Returns the buttons whose hover state changed, which is empty unless the pointer crossed a button edge
+        button = self.button_at(position)
+        if button is self.hovered:
+            return []
+        changed = []
+        if self.hovered is not None:
+            self.hovered.set_hovered(False)
+            changed.append(self.hovered)
+        if button is not None:
+            button.set_hovered(True)
+            changed.append(button)
+        self.hovered = button
+        return changed
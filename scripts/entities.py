@@ -1,126 +1,147 @@
 import math
-import random
 
 import pygame
 
-from scripts.particles import Particles
 from scripts.spark import Spark
+from scripts.utils import Playhead
+
+
+class Collisions:
+    __slots__ = ('up', 'down', 'left', 'right')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.up = False
+        self.down = False
+        self.left = False
+        self.right = False
 
 
 class PhysicsEntity:
+    __slots__ = ('game', 'type', 'pos', 'size', 'velocity', 'collisions', 'death', 'at_door', 'action', 'anim_offset',
+                 'flip', 'animation', 'last_movement', 'entity_rect')
+
     def __init__(self, game, e_type, pos, size):
         self.game = game
         self.type = e_type
         self.pos = list(pos)
         self.size = size
         self.velocity = [0, 0]
-        self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
+        self.collisions = Collisions()
+        self.entity_rect = pygame.Rect(self.pos[0], self.pos[1], size[0], size[1])
         self.death = False
         self.at_door = False
 
         self.action = ''
         self.anim_offset = (-3, -3)
         self.flip = False
+        self.animation = Playhead(self.game.assets[self.type + '/idle'])
         self.set_action('idle')
 
         self.last_movement = [0, 0]
 
     def rect(self):
-        return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
+        # The same Rect is refreshed from pos on every call, so callers must not keep it across moves
+        self.entity_rect.update(self.pos[0], self.pos[1], self.size[0], self.size[1])
+        return self.entity_rect
 
     def set_action(self, action):
         if action != self.action:
             self.action = action
-            self.animation = self.game.assets[self.type + '/' + self.action].copy()
+            self.animation.reset(self.game.assets[self.type + '/' + self.action])
 
     def update(self, tilemap, movement=(0, 0), speed=(1, 1)):
-        self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
+        self.collisions.reset()
 
         frame_movement = ((movement[0] + self.velocity[0]) * speed[0], (movement[1] + self.velocity[1]) * speed[1])
 
         self.pos[0] += frame_movement[0]
 
         entity_rect = self.rect()
+        around = tilemap.rects_around(self.pos)
         if not self.game.chest:
-            for rect in tilemap.chest_rects_around(self.pos):
+            for rect in around.get('chest', ()):
                 if rect.colliderect(entity_rect):
                     self.game.chest = 1
                     tilemap.chest_state(self.pos)
         if self.game.key_state == 1:
-            for rect in tilemap.key_rects_around(self.pos):
+            for rect in around.get('key', ()):
                 if rect.colliderect(entity_rect):
                     self.game.key += 1
                     tilemap.key_disable()
                     print(self.game.key, self.game.key_state)
-        for rect in tilemap.door_rects_around(self.pos):
+        for rect in around.get('door', ()):
             if rect.colliderect(entity_rect):
                 self.at_door = True
             else:
                 self.at_door = False
 
         entity_rect = self.rect()
-        for rect in tilemap.button_rects_around(self.pos):
+        for rect in around.get('button', ()):
             if rect.colliderect(entity_rect):
                 self.game.button = 1
                 tilemap.button_state(self.pos)
 
         entity_rect = self.rect()
-        for rect in tilemap.lever_rects_around(self.pos):
+        for rect in around.get('lever', ()):
             if rect.colliderect(entity_rect):
                 self.game.lever = 1
                 tilemap.lever_state(self.pos)
 
         entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.pos):
+        for rect in tilemap.rects_around(self.pos).get('physics', ()):
             if entity_rect.colliderect(rect):
                 if frame_movement[0] > 0:
                     entity_rect.right = rect.left
-                    self.collisions['right'] = True
+                    self.collisions.right = True
                 if frame_movement[0] < 0:
                     entity_rect.left = rect.right
-                    self.collisions['left'] = True
+                    self.collisions.left = True
                 self.pos[0] = entity_rect.x
 
         entity_rect = self.rect()
-        for rect in tilemap.platform_rects_around(self.pos):
+        for rect in tilemap.rects_around(self.pos).get('platform', ()):
             if entity_rect.colliderect(rect):
                 if frame_movement[0] > 0:
                     entity_rect.right = rect.left
-                    self.collisions['right'] = True
+                    self.collisions.right = True
                 if frame_movement[0] < 0:
                     entity_rect.left = rect.right
-                    self.collisions['left'] = True
+                    self.collisions.left = True
                 self.pos[0] = entity_rect.x
 
         self.pos[1] += frame_movement[1]
 
         entity_rect = self.rect()
-        for rect in tilemap.death_rects_around(self.pos):
+        around = tilemap.rects_around(self.pos)
+        for rect in around.get('death', ()):
             if entity_rect.colliderect(rect):
                 if frame_movement[1] != 0 or frame_movement[0] != 0:
                     self.death = True
 
         entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.pos):
+        for rect in around.get('physics', ()):
             if entity_rect.colliderect(rect):
                 if frame_movement[1] > 0:
                     entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
+                    self.collisions.down = True
                 if frame_movement[1] < 0:
                     entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
+                    self.collisions.up = True
                 self.pos[1] = entity_rect.y
 
         entity_rect = self.rect()
-        for rect in tilemap.platform_rects_around(self.pos):
+        for rect in tilemap.rects_around(self.pos).get('platform', ()):
             if entity_rect.colliderect(rect):
                 if frame_movement[1] > 0:
                     entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
+                    self.collisions.down = True
                     self.pos[1] = entity_rect.bottom - self.size[1]
                 if frame_movement[1] < 0:
                     entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
+                    self.collisions.up = True
                     self.pos[1] = entity_rect.y
 
         if movement[0] > 0:
@@ -133,17 +154,30 @@ class PhysicsEntity:
         if self.type != 'player2':
             self.velocity[1] = min(5, self.velocity[1] + 0.1)
 
-        if self.collisions['down'] or self.collisions['up']:
+        if self.collisions.down or self.collisions.up:
             self.velocity[1] = 0
 
         self.animation.update()
 
+    def sprite(self, offset=(0, 0)):
+        return self.game.atlas.blit_args(self.animation.img(self.flip),
+                                         (self.pos[0] - offset[0] + self.anim_offset[0],
+                                          self.pos[1] - offset[1] + self.anim_offset[1]))
+
+    def outline_sprite(self, offset=(0, 0)):
+        return (self.game.outlines.get(self.animation.img(self.flip)),
+                (self.pos[0] - offset[0] + self.anim_offset[0] - 1, self.pos[1] - offset[1] + self.anim_offset[1] - 1))
+
     def render(self, surf, offset=(0, 0)):
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False),
-                  (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+        return surf.blit(*self.sprite(offset))
+
+    def render_outline(self, surf, offset=(0, 0)):
+        return surf.blit(*self.outline_sprite(offset))
 
 
 class Enemy(PhysicsEntity):
+    __slots__ = ('walking',)
+
     def __init__(self, game, pos, size):
         super().__init__(game, 'enemy', pos, size)
 
@@ -152,12 +186,12 @@ class Enemy(PhysicsEntity):
     def update(self, tilemap, movement=(0, 0)):
         if self.walking:
             if tilemap.solid_check((self.rect().centerx + (-7 if self.flip else 7), self.pos[1] + 23)):
-                if self.collisions['right'] or self.collisions['left']:
+                if self.collisions.right or self.collisions.left:
                     self.flip = not self.flip
                 else:
                     movement = (movement[0] - 0.5 if self.flip else 0.5, movement[1])
             elif tilemap.solid_check_platform((self.rect().centerx + (-7 if self.flip else 7), self.pos[1] + 23)):
-                if self.collisions['right'] or self.collisions['left']:
+                if self.collisions.right or self.collisions.left:
                     self.flip = not self.flip
                 else:
                     movement = (movement[0] - 0.5 if self.flip else 0.5, movement[1])
@@ -169,22 +203,24 @@ class Enemy(PhysicsEntity):
                 if abs(dis[1]) < 16:
                     if self.flip and dis[0] < 0:
                         self.game.sfx['shoot'].play()
-                        self.game.projectiles.append([[self.rect().centerx - 7, self.rect().centery], -1.5, 0])
+                        projectile = [[self.rect().centerx - 7, self.rect().centery], -1.5, 0]
+                        self.game.projectiles.add(projectile)
                         for i in range(4):
                             self.game.sparks.append(Spark(
-                                self.game.projectiles[-1][0],
-                                random.random() - 0.5 + math.pi,
-                                2 + random.random()))
+                                projectile[0],
+                                self.game.rng.random() - 0.5 + math.pi,
+                                2 + self.game.rng.random()))
                     if not self.flip and dis[0] > 0:
                         self.game.sfx['shoot'].play()
-                        self.game.projectiles.append([[self.rect().centerx + 7, self.rect().centery], 1.5, 0])
+                        projectile = [[self.rect().centerx + 7, self.rect().centery], 1.5, 0]
+                        self.game.projectiles.add(projectile)
                         for i in range(4):
                             self.game.sparks.append(Spark(
-                                self.game.projectiles[-1][0],
-                                random.random() - 0.5,
-                                2 + random.random()))
-        elif random.random() < 0.01:
-            self.walking = random.randint(30, 120)
+                                projectile[0],
+                                self.game.rng.random() - 0.5,
+                                2 + self.game.rng.random()))
+        elif self.game.rng.random() < 0.01:
+            self.walking = self.game.rng.randint(30, 120)
 
         super().update(tilemap, movement=movement)
 
@@ -197,24 +233,25 @@ class Enemy(PhysicsEntity):
             self.game.screenshake = max(16, self.game.screenshake)
             self.game.sfx['hit'].play()
             for i in range(30):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 5
-                self.game.sparks.append(Spark(self.rect().center, angle, 2 + random.random()))
-                self.game.particles.append(
-                    Particles(self.game, 'particle', self.rect().center,
-                              velocity=[math.cos(angle + math.pi) * speed * 0.5,
-                                        math.sin(angle + math.pi) * speed],
-                              frame=random.randint(0, 7)))
-            self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-            self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 5
+                self.game.sparks.append(Spark(self.rect().center, angle, 2 + self.game.rng.random()))
+                self.game.particles.add('particle', self.rect().center,
+                                        velocity=(math.cos(angle + math.pi) * speed * 0.5,
+                                                  math.sin(angle + math.pi) * speed),
+                                        frame=self.game.rng.randint(0, 7))
+            self.game.sparks.append(Spark(self.rect().center, 0, 5 + self.game.rng.random()))
+            self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + self.game.rng.random()))
             self.game.rats += 1
             return True
 
     def render(self, surf, offset=(0, 0)):
-        super().render(surf, offset=offset)
+        return super().render(surf, offset=offset)
 
 
 class Player(PhysicsEntity):
+    __slots__ = ('air_time', 'jumps', 'wall_slide', 'dashing')
+
     def __init__(self, game, pos, size):
         super().__init__(game, 'player', pos, size)
         self.air_time = 0
@@ -232,16 +269,16 @@ class Player(PhysicsEntity):
                 self.game.screenshake = max(16, self.game.screenshake)
             self.game.dead += 1
 
-        if self.collisions['down']:
+        if self.collisions.down:
             self.air_time = 0
             self.jumps = 1
 
         self.wall_slide = False
-        if (self.collisions['right'] or self.collisions['left']) and self.air_time > 4:
+        if (self.collisions.right or self.collisions.left) and self.air_time > 4:
             self.air_time = 5
             self.wall_slide = True
             self.velocity[1] = min(self.velocity[1], 0.5)
-            if self.collisions['right']:
+            if self.collisions.right:
                 self.flip = False
             else:
                 self.flip = True
@@ -257,12 +294,11 @@ class Player(PhysicsEntity):
 
         if abs(self.dashing) in (60, 50):
             for i in range(20):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 0.5 + 0.5
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(Particles(self.game, 'particle', self.rect().center,
-                                                     velocity=pvelocity,
-                                                     frame=random.randint(0, 7)))
+                self.game.particles.add('particle', self.rect().center, velocity=pvelocity,
+                                        frame=self.game.rng.randint(0, 7))
         if self.dashing > 0:
             self.dashing = max(0, self.dashing - 1)
         if self.dashing < 0:
@@ -271,10 +307,9 @@ class Player(PhysicsEntity):
             self.velocity[0] = abs(self.dashing) / self.dashing * 8
             if abs(self.dashing) == 51:
                 self.velocity[0] *= 0.1
-            pvelocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-            self.game.particles.append(Particles(self.game, 'particle', self.rect().center,
-                                                 velocity=pvelocity,
-                                                 frame=random.randint(0, 7)))
+            pvelocity = [abs(self.dashing) / self.dashing * self.game.rng.random() * 3, 0]
+            self.game.particles.add('particle', self.rect().center, velocity=pvelocity,
+                                    frame=self.game.rng.randint(0, 7))
 
         if self.velocity[0] > 0:
             self.velocity[0] = max(self.velocity[0] - 0.1, 0)
@@ -283,7 +318,7 @@ class Player(PhysicsEntity):
 
     def render(self, surf, offset=(0, 0)):
 
-        super().render(surf, offset=offset)
+        return super().render(surf, offset=offset)
 
     def jump(self):
         if self.wall_slide:
@@ -316,6 +351,8 @@ class Player(PhysicsEntity):
 
 
 class Bird(PhysicsEntity):
+    __slots__ = ()
+
     def __init__(self, game, pos, size):
         super().__init__(game, 'player2', pos, size)
 
@@ -328,4 +365,4 @@ class Bird(PhysicsEntity):
             self.velocity[0] = min(self.velocity[0] + 0.1, 0)
 
     def render(self, surf, offset=(0, 0)):
-        super().render(surf, offset=offset)
+        return super().render(surf, offset=offset)
@@ -0,0 +1,148 @@
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAP_MAGIC = b'WWMP'
+MAP_VERSION = 1
+HEADER = struct.Struct('<4sHHHHII')
+NAME_LENGTH = struct.Struct('<B')
+CHUNK_ENTRY = struct.Struct('<iiIH')
+TYPE_ID = struct.Struct('<H')
+CELL = struct.Struct('<HH')
+OFFGRID = struct.Struct('<HHdd')
+MAP_CHUNK_SIZE = 16
+
+stale_warned = set()
+
+# Layout: header, type names, chunk directory (position, data offset and the types the chunk holds), offgrid tiles,
+# then one dense array of (type id + 1, variant) cells per chunk with 0 marking an empty cell.
+# Grid tiles are stored by cell, so a tile's pos is always its location when the map is read back.
+
+
+def save_map(path, tile_size, chunk_size, tiles, offgrid):
+    types = sorted({tile_type for tile_type, variant in tiles.values()} | {tile[0] for tile in offgrid})
+    type_ids = {tile_type: i for i, tile_type in enumerate(types)}
+
+    chunks = {}
+    for loc, tile in tiles.items():
+        chunks.setdefault((loc[0] // chunk_size, loc[1] // chunk_size), {})[loc] = tile
+
+    names = b''.join(NAME_LENGTH.pack(len(name)) + name for name in [t.encode('utf-8') for t in types])
+    directory_size = sum(CHUNK_ENTRY.size + TYPE_ID.size * len({t for t, v in cells.values()})
+                         for cells in chunks.values())
+    offset = HEADER.size + len(names) + directory_size + OFFGRID.size * len(offgrid)
+
+    directory = []
+    data = []
+    for chunk in sorted(chunks):
+        cells = chunks[chunk]
+        chunk_types = sorted({type_ids[t] for t, v in cells.values()})
+        directory.append(CHUNK_ENTRY.pack(chunk[0], chunk[1], offset, len(chunk_types)))
+        directory.extend(TYPE_ID.pack(type_id) for type_id in chunk_types)
+
+        array = bytearray(CELL.size * chunk_size * chunk_size)
+        for loc, (tile_type, variant) in cells.items():
+            index = (loc[1] - chunk[1] * chunk_size) * chunk_size + loc[0] - chunk[0] * chunk_size
+            CELL.pack_into(array, index * CELL.size, type_ids[tile_type] + 1, variant)
+        data.append(bytes(array))
+        offset += len(array)
+
+    f = open(path, 'wb')
+    f.write(HEADER.pack(MAP_MAGIC, MAP_VERSION, tile_size, chunk_size, len(types), len(chunks), len(offgrid)))
+    f.write(names)
+    f.write(b''.join(directory))
+    for tile_type, variant, x, y in offgrid:
+        f.write(OFFGRID.pack(type_ids[tile_type], variant, x, y))
+    f.write(b''.join(data))
+    f.close()
+
+
+class MapFile:
+    # Only the header, directory and offgrid section are read up front; chunk arrays are decoded on request
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.tile_size, self.chunk_size, type_count, chunk_count, offgrid_count = \
+            HEADER.unpack_from(self.data)
+        if magic != MAP_MAGIC or version != MAP_VERSION:
+            self.close()
+            raise ValueError(path + ' is not a map file')
+        position = HEADER.size
+
+        self.types = []
+        for i in range(type_count):
+            length = NAME_LENGTH.unpack_from(self.data, position)[0]
+            position += NAME_LENGTH.size
+            self.types.append(self.data[position:position + length].decode('utf-8'))
+            position += length
+
+        self.chunks = {}
+        for i in range(chunk_count):
+            cx, cy, offset, count = CHUNK_ENTRY.unpack_from(self.data, position)
+            position += CHUNK_ENTRY.size
+            chunk_types = {self.types[TYPE_ID.unpack_from(self.data, position + j * TYPE_ID.size)[0]]
+                           for j in range(count)}
+            position += TYPE_ID.size * count
+            self.chunks[(cx, cy)] = (chunk_types, offset)
+
+        self.offgrid = []
+        for type_id, variant, x, y in OFFGRID.iter_unpack(self.data[position:position + OFFGRID.size * offgrid_count]):
+            self.offgrid.append((self.types[type_id], variant, x, y))
+
+    def decode_chunk(self, chunk):
+        offset = self.chunks[chunk][1]
+        size = CELL.size * self.chunk_size * self.chunk_size
+        tiles = []
+        for index, (type_id, variant) in enumerate(CELL.iter_unpack(self.data[offset:offset + size])):
+            if type_id:
+                loc = (chunk[0] * self.chunk_size + index % self.chunk_size,
+                       chunk[1] * self.chunk_size + index // self.chunk_size)
+                tiles.append((loc, self.types[type_id - 1], variant))
+        return tiles
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def map_path(stem):
+    # The converted map is only used while it is at least as new as its JSON source, so a hand-edited JSON is
+    # never shadowed by an out-of-date conversion
+    json_path = stem + '.json'
+    wwm_path = stem + '.wwm'
+    if not os.path.exists(wwm_path):
+        return json_path
+    if os.path.exists(json_path) and os.path.getmtime(wwm_path) < os.path.getmtime(json_path):
+        if wwm_path not in stale_warned:
+            stale_warned.add(wwm_path)
+            print(wwm_path, 'is older than', json_path + ', loading the JSON instead;',
+                  're-run python -m scripts.mapfile', json_path)
+        return json_path
+    return wwm_path
+
+
+def convert(path, out_path=None):
+    if out_path is None:
+        out_path = os.path.splitext(path)[0] + '.wwm'
+    f = open(path, 'r')
+    map_data = json.load(f)
+    f.close()
+
+    tiles = {}
+    for loc, tile in map_data['tilemap'].items():
+        x, y = loc.split(';')
+        tiles[(int(x), int(y))] = (tile['type'], tile['variant'])
+    offgrid = [(tile['type'], tile['variant'], tile['pos'][0], tile['pos'][1]) for tile in map_data['offgrid']]
+    save_map(out_path, map_data['tile_size'], MAP_CHUNK_SIZE, tiles, offgrid)
+    return out_path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python -m scripts.mapfile MAP.json [MAP.json ...]')
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        print(path, '->', convert(path))
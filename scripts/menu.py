@@ -0,0 +1,59 @@
+import sys
+
+import pygame
+
+from scripts.button import ButtonGroup
+
+MENU_FPS = 30
+EXPOSE_EVENTS = {pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.VIDEOEXPOSE}
+
+
+class Menu:
+    # Retained-mode menu: the buttons are built once and only the parts of the screen that changed are redrawn
+    def __init__(self, screen, background, buttons):
+        self.screen = screen
+        self.background = background
+        self.buttons = ButtonGroup(buttons)
+        self.clock = pygame.time.Clock()
+
+    def draw(self):
+        self.screen.blit(self.background, (0, 0))
+        for button in self.buttons:
+            button.update(self.screen)
+        pygame.display.update()
+
+    def draw_buttons(self, buttons):
+        rects = [button.area() for button in buttons]
+        for rect in rects:
+            self.screen.blit(self.background, rect, rect)
+        # Neighbours overlapping a cleared area are drawn again too, in their usual order
+        for button in self.buttons:
+            if button.area().collidelist(rects) != -1:
+                button.update(self.screen)
+        pygame.display.update(rects)
+
+    def run(self):
+        self.buttons.hover(pygame.mouse.get_pos())
+        self.draw()
+        while True:
+            redraw = False
+            changed = []
+            # Block until something happens so an idle menu does not use the CPU
+            for event in [pygame.event.wait()] + pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    button = self.buttons.button_at(event.pos)
+                    if button is not None:
+                        return button
+                if event.type == pygame.MOUSEMOTION:
+                    changed.extend(self.buttons.hover(event.pos))
+                if event.type in EXPOSE_EVENTS:
+                    redraw = True
+
+            if redraw:
+                self.draw()
+            elif changed:
+                self.draw_buttons(changed)
+            self.clock.tick(MENU_FPS)
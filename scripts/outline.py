@@ -0,0 +1,34 @@
+import pygame
+
+OUTLINE_COLOR = (0, 0, 0, 180)
+OUTLINE_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+def make_outline(surf):
+    # Same result as blitting the surface silhouette once per offset, padded by one pixel on each side
+    silhouette = pygame.mask.from_surface(surf).to_surface(setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0))
+    outline = pygame.Surface((surf.get_width() + 2, surf.get_height() + 2), pygame.SRCALPHA)
+    for offset in OUTLINE_OFFSETS:
+        outline.blit(silhouette, (offset[0] + 1, offset[1] + 1))
+    return outline
+
+
+def patch_outline(outline, surf, rect):
+    # Redoes make_outline(surf) in place over rect (in surf coordinates) and its one pixel border, which only
+    # depends on the surface within two pixels of rect
+    area = rect.inflate(2, 2)
+    source = area.inflate(2, 2).clip(surf.get_rect())
+    target = area.move(1, 1).clip(outline.get_rect())
+    outline.fill((0, 0, 0, 0), target)
+    if source:
+        outline.blit(make_outline(surf.subsurface(source)), target, target.move(-source.x, -source.y))
+
+
+class OutlineCache:
+    def __init__(self):
+        self.outlines = {}
+
+    def get(self, img):
+        if img not in self.outlines:
+            self.outlines[img] = make_outline(img)
+        return self.outlines[img]
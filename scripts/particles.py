@@ -1,25 +1,90 @@
-class Particles:
-    def __init__(self, game, p_type, pos, velocity=[0, 0], frame=0):
+import math
+
+PARTICLE_CAPACITY = 4096
+
+
+class ParticleSystem:
+    # Particles are stored as parallel lists; a dead particle is swapped with the last live one
+    def __init__(self, game, capacity=PARTICLE_CAPACITY):
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets['particle/' + p_type].copy()
-        self.animation.frame = frame
+        self.capacity = capacity
+        self.count = 0
+        self.kinds = {}
+        self.kind_types = []
+        self.animations = []
+
+        self.x = [0.0] * capacity
+        self.y = [0.0] * capacity
+        self.vx = [0.0] * capacity
+        self.vy = [0.0] * capacity
+        self.frame = [0] * capacity
+        self.kind = [0] * capacity
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def add(self, p_type, pos, velocity=(0, 0), frame=0):
+        if self.count == self.capacity:
+            return
+        if p_type not in self.kinds:
+            self.kinds[p_type] = len(self.animations)
+            self.kind_types.append(p_type)
+            self.animations.append(self.game.assets['particle/' + p_type])
+
+        i = self.count
+        self.x[i] = pos[0]
+        self.y[i] = pos[1]
+        self.vx[i] = velocity[0]
+        self.vy[i] = velocity[1]
+        self.frame[i] = frame
+        self.kind[i] = self.kinds[p_type]
+        self.count += 1
+
+    def remove(self, i):
+        last = self.count - 1
+        self.x[i] = self.x[last]
+        self.y[i] = self.y[last]
+        self.vx[i] = self.vx[last]
+        self.vy[i] = self.vy[last]
+        self.frame[i] = self.frame[last]
+        self.kind[i] = self.kind[last]
+        self.count = last
 
     def update(self):
-        kill = False
-        if self.animation.done:
-            kill = True
+        x, y, vx, vy, frame, kind = self.x, self.y, self.vx, self.vy, self.frame, self.kind
+        leaf = self.kinds.get('leaf')
+
+        i = 0
+        while i < self.count:
+            animation = self.animations[kind[i]]
+            length = animation.length
+            kill = not animation.loop and frame[i] >= length - 1
+
+            x[i] += vx[i]
+            y[i] += vy[i]
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+            if animation.loop:
+                frame[i] = (frame[i] + 1) % length
+            else:
+                frame[i] = min(frame[i] + 1, length - 1)
 
-        self.animation.update()
+            if kind[i] == leaf:
+                x[i] += math.sin(frame[i] * 0.035) * 0.3
 
-        return kill
+            if kill:
+                self.remove(i)
+            else:
+                i += 1
 
     def render(self, surf, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() // 2,
-                        self.pos[1] - offset[1] - img.get_height() // 2))
+        atlas = self.game.atlas
+        blits = []
+        for i in range(self.count):
+            animation = self.animations[self.kind[i]]
+            img = animation.img(self.frame[i])
+            blits.append(atlas.blit_args(img, (self.x[i] - offset[0] - img.get_width() // 2,
+                                               self.y[i] - offset[1] - img.get_height() // 2)))
+        return surf.blits(blits)
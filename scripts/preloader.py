@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Preloader:
+    # Runs loading jobs on a single background thread; take() returns a finished job's result, waiting if needed
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.jobs = {}
+
+    def request(self, key, job, *args):
+        if key not in self.jobs:
+            self.jobs[key] = self.pool.submit(job, *args)
+
+    def take(self, key):
+        job = self.jobs.pop(key, None)
+        if job is None:
+            return None
+        return job.result()
+
+    def discard(self, predicate):
+        # Forgets the jobs whose key matches; queued ones are cancelled, a running one is dropped when it finishes
+        for key in [key for key in self.jobs if predicate(key)]:
+            self.jobs.pop(key).cancel()
+
+    def shutdown(self):
+        self.jobs = {}
+        self.pool.shutdown(wait=False, cancel_futures=True)
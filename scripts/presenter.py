@@ -0,0 +1,44 @@
+import pygame
+
+
+class Presenter:
+    def __init__(self, screen):
+        self.screen = screen
+        self.scaled = None
+        self.last_rects = None
+        self.last_offset = None
+
+    def invalidate(self):
+        self.last_rects = None
+
+    def scale_rects(self, surf, rects):
+        if surf.get_size() == self.screen.get_size():
+            return rects
+        scale_x = self.screen.get_width() / surf.get_width()
+        scale_y = self.screen.get_height() / surf.get_height()
+        return [pygame.Rect(int(rect.x * scale_x) - 1, int(rect.y * scale_y) - 1,
+                            int(rect.width * scale_x) + 3, int(rect.height * scale_y) + 3) for rect in rects]
+
+    def frame(self, surf):
+        if surf.get_size() == self.screen.get_size():
+            return surf
+        if self.scaled is None or self.scaled.get_size() != self.screen.get_size():
+            self.scaled = pygame.Surface(self.screen.get_size(), 0, surf)
+        pygame.transform.scale(surf, self.screen.get_size(), self.scaled)
+        return self.scaled
+
+    def present(self, surf, offset=(0, 0), rects=None, full=False):
+        # rects are the regions of surf that changed this frame; the previous frame's regions are pushed too
+        frame = self.frame(surf)
+        if rects is not None:
+            rects = self.scale_rects(surf, rects)
+        if full or rects is None or self.last_rects is None or offset != self.last_offset:
+            self.screen.blit(frame, offset)
+            pygame.display.update()
+        else:
+            damage = rects + self.last_rects
+            for rect in damage:
+                self.screen.blit(frame, rect, rect)
+            pygame.display.update(damage)
+        self.last_rects = rects
+        self.last_offset = offset
@@ -0,0 +1,120 @@
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+PROFILE_WINDOW = 300
+FRAME_BUDGET_MS = 1000 / 60
+PERCENTILES = [50, 95, 99]
+
+
+class Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, (time.perf_counter() - self.start) * 1000)
+
+
+class NullPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullProfiler:
+    def __init__(self):
+        self.null_phase = NullPhase()
+
+    def phase(self, name):
+        return self.null_phase
+
+    def add(self, name, ms):
+        pass
+
+    def end_frame(self, **labels):
+        pass
+
+
+class FrameProfiler:
+    def __init__(self, window=PROFILE_WINDOW, keep_trace=False):
+        self.window = window
+        self.phases = {}
+        self.history = {}
+        self.current = {}
+        self.trace = [] if keep_trace else None
+        self.frame = 0
+
+    def phase(self, name):
+        if name not in self.phases:
+            self.phases[name] = Phase(self, name)
+            self.history[name] = deque(maxlen=self.window)
+        return self.phases[name]
+
+    def add(self, name, ms):
+        self.current[name] = self.current.get(name, 0) + ms
+
+    def end_frame(self, **labels):
+        total = sum(self.current.values())
+        for name in self.history:
+            self.history[name].append(self.current.get(name, 0))
+        self.history.setdefault('total', deque(maxlen=self.window)).append(total)
+        if self.trace is not None:
+            row = {'frame': self.frame}
+            row.update(labels)
+            row.update(self.current)
+            row['total'] = total
+            self.trace.append(row)
+        self.current = {}
+        self.frame += 1
+
+    def percentiles(self, name):
+        samples = sorted(self.history[name])
+        if not samples:
+            return [0 for percentile in PERCENTILES]
+        return [samples[min(len(samples) - 1, len(samples) * percentile // 100)] for percentile in PERCENTILES]
+
+    def render_overlay(self, surf, font, pos=(10, 10)):
+        lines = ['phase  ' + '  '.join('p' + str(percentile) for percentile in PERCENTILES) + '  (ms)']
+        for name in list(self.phases) + ['total']:
+            if name in self.history:
+                lines.append(name + '  ' + '  '.join(format(ms, '.2f') for ms in self.percentiles(name)))
+
+        line_height = font.get_linesize()
+        width = max(font.size(line)[0] for line in lines)
+        overlay = pygame.Surface((width + 10, line_height * len(lines) + 10), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 160))
+        over_budget = self.percentiles('total')[1] > FRAME_BUDGET_MS if 'total' in self.history else False
+        for i, line in enumerate(lines):
+            color = (255, 90, 90) if i == len(lines) - 1 and over_budget else (255, 255, 255)
+            # Not render_text: these lines change nearly every frame and would evict the cached UI labels
+            overlay.blit(font.render(line, True, color), (5, 5 + i * line_height))
+        return surf.blit(overlay, pos)
+
+    def export(self, path):
+        if self.trace is None:
+            return
+        if path.endswith('.csv'):
+            columns = []
+            for row in self.trace:
+                for column in row:
+                    if column not in columns:
+                        columns.append(column)
+            f = open(path, 'w', newline='')
+            writer = csv.DictWriter(f, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.trace)
+            f.close()
+        else:
+            f = open(path, 'w')
+            json.dump({'budget_ms': FRAME_BUDGET_MS, 'frames': self.trace}, f)
+            f.close()
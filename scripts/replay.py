@@ -0,0 +1,97 @@
+import struct
+import sys
+import time
+
+from scripts.simulation import Simulation, Inputs, init_headless
+
+REPLAY_MAGIC = b'WWRP'
+REPLAY_VERSION = 1
+HEADER = struct.Struct('<4sHQH')
+MAX_SEED = 2 ** 64 - 1
+RUN = struct.Struct('<BH')
+MAX_RUN = 0xFFFF
+
+# One byte per tick: cat left/right, bird left/right/up/down, jump, dash
+INPUT_BITS = 8
+
+
+def pack_inputs(inputs):
+    flags = list(inputs.movement) + list(inputs.movement_bird) + [inputs.jump, inputs.dash]
+    code = 0
+    for bit, flag in enumerate(flags):
+        if flag:
+            code |= 1 << bit
+    return code
+
+
+def unpack_inputs(code):
+    flags = [bool(code & (1 << bit)) for bit in range(INPUT_BITS)]
+    return Inputs(flags[0:2], flags[2:6], flags[6], flags[7])
+
+
+class Recorder:
+    def __init__(self, seed, level=0):
+        self.seed = seed
+        self.level = level
+        self.runs = []
+
+    def record(self, inputs):
+        code = pack_inputs(inputs)
+        if self.runs and self.runs[-1][0] == code and self.runs[-1][1] < MAX_RUN:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([code, 1])
+
+    def save(self, path):
+        f = open(path, 'wb')
+        f.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, self.level))
+        for code, count in self.runs:
+            f.write(RUN.pack(code, count))
+        f.close()
+
+
+class Replay:
+    def __init__(self, path):
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+
+        magic, version, self.seed, self.level = HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(path + ' is not a replay file')
+        self.runs = [RUN.unpack_from(data, offset) for offset in range(HEADER.size, len(data), RUN.size)]
+
+    def __len__(self):
+        return sum(count for code, count in self.runs)
+
+    def inputs(self):
+        for code, count in self.runs:
+            inputs = unpack_inputs(code)
+            for i in range(count):
+                yield inputs
+
+
+def run_headless(path, assets=None):
+    replay = Replay(path)
+    if assets is None:
+        from scripts.assets import load_game_assets
+
+        init_headless()
+        assets = load_game_assets()
+
+    sim = Simulation(assets, seed=replay.seed)
+    sim.level = replay.level
+    sim.load_level(replay.level)
+    for inputs in replay.inputs():
+        sim.step(inputs)
+        if sim.finished:
+            break
+    return sim
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    sim = run_headless(sys.argv[1])
+    elapsed = time.perf_counter() - start
+    print(sim.tick, 'ticks replayed in', round(elapsed, 3), 's')
+    print('level', sim.level, 'finished' if sim.finished else '', 'player', sim.player.pos, 'bird', sim.bird.pos)
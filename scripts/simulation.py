@@ -0,0 +1,220 @@
+import math
+import os
+import random
+import sys
+import time
+
+import pygame
+
+from scripts.atlas import Atlas
+from scripts.entities import Player, Enemy, Bird
+from scripts.mapfile import map_path
+from scripts.outline import OutlineCache
+from scripts.particles import ParticleSystem
+from scripts.profiler import NullProfiler
+from scripts.slotmap import SlotMap
+from scripts.spark import Spark, SparkSystem
+from scripts.tilemap import Tilemap
+
+SFX_NAMES = ['jump', 'dash', 'hit', 'shoot']
+SPAWNERS = [('spawners', 0), ('spawners', 1), ('spawners', 2)]
+
+
+class NullSound:
+    def play(self):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+
+class Inputs:
+    def __init__(self, movement=(False, False), movement_bird=(False, False, False, False), jump=False, dash=False):
+        self.movement = list(movement)
+        self.movement_bird = list(movement_bird)
+        self.jump = jump
+        self.dash = dash
+
+
+class Simulation:
+    def __init__(self, assets, sfx=None, seed=None):
+        self.assets = assets
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.sfx = sfx if sfx is not None else {name: NullSound() for name in SFX_NAMES}
+        self.atlas = Atlas(assets)
+        self.outlines = OutlineCache()
+        self.observers = []
+        self.profiler = NullProfiler()
+        self.preloader = None
+        # Screen area the observers draw the level in; prepared levels come with it already rendered
+        self.view = None
+
+        self.player = Player(self, (200, 1000), (35, 35))
+
+        self.bird = Bird(self, (1800, 950), (40, 35))
+
+        self.tilemap = Tilemap(self, tile_size=64)
+
+        self.particles = ParticleSystem(self)
+        self.sparks = SparkSystem()
+        self.enemies = SlotMap()
+        self.projectiles = SlotMap()
+
+        self.level_count = len({os.path.splitext(name)[0] for name in os.listdir('data/maps')})
+        self.finished = False
+        self.screenshake = 0
+        self.level = 0
+        self.tick = 0
+
+    def prepare_level(self, map_id, decode_all=False):
+        # Touches nothing but the new Tilemap, so the preloader can run it on its worker thread, chunk surfaces
+        # and outlines for the view included
+        tilemap = Tilemap(self, tile_size=64)
+        tilemap.load(map_path('data/maps/' + str(map_id)))
+        spawners = tilemap.extract(SPAWNERS)
+        if decode_all:
+            tilemap.load_all()
+        if self.view is not None:
+            tilemap.prerender(self.view)
+        return tilemap, spawners
+
+    def preload_level(self, map_id):
+        if self.preloader and map_id < self.level_count:
+            self.preloader.request(('level', map_id), self.prepare_level, map_id, True)
+
+    def load_level(self, map_id):
+        prepared = None
+        if self.preloader:
+            prepared = self.preloader.take(('level', map_id))
+            # A level prepared for a reload that never happened (e.g. the door was reached while dying) is stale
+            self.preloader.discard(lambda key: key[0] == 'level')
+        self.tilemap.close_map_file()
+        self.tilemap, spawners = prepared or self.prepare_level(map_id)
+
+        self.enemies.clear()
+        for spawner in spawners:
+            if spawner.variant == 0:
+                self.player.pos = spawner.pos.copy()
+                self.player.air_time = 0
+            elif spawner.variant == 1:
+                self.bird.pos = spawner.pos.copy()
+            else:
+                self.enemies.add(Enemy(self, spawner.pos, (56, 18)))
+
+        self.player.death = False
+        self.bird.death = False
+
+        self.player.at_door = False
+        self.bird.at_door = False
+
+        self.projectiles.clear()
+        self.particles.clear()
+        self.sparks.clear()
+        self.chest = 0
+        self.button = 0
+        self.lever = 1
+        self.key = 0
+        self.key_state = 0
+        self.platform_has_moved = False
+
+        self.rats = 0
+        self.rats_max = len(self.enemies)
+
+        self.dead = 0
+        self.transition = -30
+
+        for observer in self.observers:
+            observer.level_loaded(self)
+
+        self.preload_level(map_id + 1)
+
+    def step(self, inputs):
+        if inputs.jump:
+            if self.player.jump():
+                self.sfx['jump'].play()
+        if inputs.dash:
+            self.player.dash()
+
+        with self.profiler.phase('update:level'):
+            self.screenshake = max(0, self.screenshake - 1)
+
+            if self.player.at_door and self.bird.at_door and self.key:
+                self.transition += 1
+                if self.transition > 30:
+                    self.level += 1
+                    if self.level > self.level_count - 1:
+                        self.finished = True
+                        return
+                    self.load_level(self.level)
+            if self.transition < 0:
+                self.transition += 1
+
+            if (self.player.death or self.bird.death) and not self.dead:
+                self.dead = 1
+
+            if self.dead:
+                if self.dead == 1:
+                    self.preload_level(self.level)
+                    for i in range(30):
+                        angle = self.rng.random() * math.pi * 2
+                        speed = self.rng.random() * 5
+                        self.sparks.append(Spark(self.player.rect().center, angle, 2 + self.rng.random()))
+                        self.particles.add('particle', self.player.rect().center,
+                                           velocity=(math.cos(angle + math.pi) * speed * 0.5,
+                                                     math.sin(angle + math.pi) * speed),
+                                           frame=self.rng.randint(0, 7))
+                self.dead += 1
+                if self.dead >= 10:
+                    self.transition = min(30, self.transition + 1)
+                if self.dead > 40:
+                    self.load_level(self.level)
+
+        with self.profiler.phase('update:enemies'):
+            for handle, enemy in self.enemies.items():
+                kill = enemy.update(self.tilemap, (0, 0))
+                if kill:
+                    self.enemies.remove(handle)
+
+            if self.rats_max:
+                if self.rats == self.rats_max:
+                    if self.key_state == 0:
+                        self.tilemap.key_enable()
+
+        with self.profiler.phase('update:players'):
+            if not self.dead:
+                self.player.update(self.tilemap, (inputs.movement[1] - inputs.movement[0], 0), (3, 2))
+                self.bird.update(self.tilemap, (inputs.movement_bird[1] - inputs.movement_bird[0],
+                                                inputs.movement_bird[3] - inputs.movement_bird[2]), (3, 3))
+
+        with self.profiler.phase('update:sparks'):
+            self.sparks.update()
+
+        with self.profiler.phase('update:particles'):
+            self.particles.update()
+
+        self.tick += 1
+
+
+def init_headless():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+
+
+if __name__ == '__main__':
+    from scripts.assets import load_game_assets
+
+    init_headless()
+    sim = Simulation(load_game_assets())
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for level in range(sim.level_count):
+        sim.level = level
+        sim.load_level(level)
+        start = time.perf_counter()
+        idle = Inputs()
+        for i in range(ticks):
+            sim.step(idle)
+        elapsed = time.perf_counter() - start
+        print('level', level, ':', ticks, 'ticks in', round(elapsed, 3), 's',
+              '(' + str(int(ticks / elapsed)) + ' ticks/s)')
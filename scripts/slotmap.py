@@ -0,0 +1,61 @@
+class SlotMap:
+    # Handles are (slot, generation) pairs; a removed slot bumps its generation so stale handles stop resolving
+    def __init__(self):
+        self.slots = []
+        self.generations = []
+        self.free = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for item in self.slots:
+            if item is not None:
+                yield item
+
+    def __contains__(self, handle):
+        return self.get(handle) is not None
+
+    def items(self):
+        for slot, item in enumerate(self.slots):
+            if item is not None:
+                yield (slot, self.generations[slot]), item
+
+    def add(self, item):
+        if self.free:
+            slot = self.free.pop()
+            self.slots[slot] = item
+        else:
+            slot = len(self.slots)
+            self.slots.append(item)
+            self.generations.append(0)
+        self.count += 1
+        return slot, self.generations[slot]
+
+    def get(self, handle):
+        slot, generation = handle
+        if slot < len(self.slots) and self.generations[slot] == generation:
+            return self.slots[slot]
+        return None
+
+    def remove(self, handle):
+        slot, generation = handle
+        if self.generations[slot] != generation or self.slots[slot] is None:
+            return None
+        item = self.slots[slot]
+        self.slots[slot] = None
+        self.generations[slot] += 1
+        self.free.append(slot)
+        self.count -= 1
+        return item
+
+    def clear(self):
+        # Slots are kept and their generations bumped, so handles taken before the clear never resolve again
+        for slot, item in enumerate(self.slots):
+            if item is not None:
+                self.slots[slot] = None
+                self.generations[slot] += 1
+        # Reversed so that add() refills the slots from 0 upwards, in the same order as an empty map
+        self.free = list(range(len(self.slots) - 1, -1, -1))
+        self.count = 0
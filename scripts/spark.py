@@ -2,6 +2,10 @@ import math
 
 import pygame
 
+from scripts.outline import OUTLINE_COLOR, OUTLINE_OFFSETS
+
+SPARK_CAPACITY = 1024
+
 
 class Spark:
     def __init__(self, pos, angle, speed):
@@ -9,23 +13,100 @@ class Spark:
         self.angle = angle
         self.speed = speed
 
+
+class SparkSystem:
+    # Sparks are stored as parallel lists; the trig for each spark is done once when it is added
+    def __init__(self, capacity=SPARK_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+
+        self.x = [0.0] * capacity
+        self.y = [0.0] * capacity
+        self.speed = [0.0] * capacity
+        self.directions = [None] * capacity
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def append(self, spark):
+        self.add(spark.pos, spark.angle, spark.speed)
+
+    def add(self, pos, angle, speed):
+        if self.count == self.capacity:
+            return
+        i = self.count
+        self.x[i] = pos[0]
+        self.y[i] = pos[1]
+        self.speed[i] = speed
+        self.directions[i] = (math.cos(angle), math.sin(angle),
+                              math.cos(angle + math.pi * 0.5), math.sin(angle + math.pi * 0.5),
+                              math.cos(angle + math.pi), math.sin(angle + math.pi),
+                              math.cos(angle - math.pi * 0.5), math.sin(angle - math.pi * 0.5))
+        self.count += 1
+
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
+        x, y, speed, directions = self.x, self.y, self.speed, self.directions
+        for i in range(self.count):
+            direction = directions[i]
+            x[i] += direction[0] * speed[i]
+            y[i] += direction[1] * speed[i]
+            speed[i] = max(0, speed[i] - 0.1)
 
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed
+        live = 0
+        for i in range(self.count):
+            if speed[i]:
+                if live != i:
+                    x[live] = x[i]
+                    y[live] = y[i]
+                    speed[live] = speed[i]
+                    directions[live] = directions[i]
+                live += 1
+        self.count = live
+
+    def polygons(self, offset=(0, 0)):
+        x, y, speed, directions = self.x, self.y, self.speed, self.directions
+        polygons = []
+        for i in range(self.count):
+            c0, s0, c1, s1, c2, s2, c3, s3 = directions[i]
+            px = x[i] - offset[0]
+            py = y[i] - offset[1]
+            long = speed[i] * 3
+            short = speed[i] * 0.5
+            polygons.append(((px + c0 * long, py + s0 * long),
+                             (px + c1 * short, py + s1 * long),
+                             (px + c2 * long, py + s2 * long),
+                             (px + c3 * short, py + s3 * long)))
+        return polygons
 
     def render(self, surf, offset=(0, 0)):
-        render_points = [
-            (self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0],
-             self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[0],
-             self.pos[1] + math.sin(self.angle + math.pi * 0.5) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi) * self.speed * 3 - offset[0],
-             self.pos[1] + math.sin(self.angle + math.pi) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[0],
-             self.pos[1] + math.sin(self.angle - math.pi * 0.5) * self.speed * 3 - offset[1]),
-        ]
-
-        pygame.draw.polygon(surf, (255, 255, 255), render_points)
+        return [pygame.draw.polygon(surf, (255, 255, 255), points) for points in self.polygons(offset)]
+
+    def render_outline(self, surf, offset=(0, 0), covered=None):
+        # All sparks share one silhouette, so overlapping sparks don't darken the outline twice. Pixels already
+        # drawn on the covered layer have an outline of their own and are left out of it for the same reason
+        polygons = self.polygons(offset)
+        if not polygons:
+            return
+        xs = [x for points in polygons for x, y in points]
+        ys = [y for points in polygons for x, y in points]
+        left = math.floor(min(xs)) - 1
+        top = math.floor(min(ys)) - 1
+        bounds = pygame.Rect(left, top, math.floor(max(xs)) - left + 2, math.floor(max(ys)) - top + 2)
+        if covered is not None:
+            # Only the part of a spark that lands on the layer is outlined, as with the rest of the layer
+            bounds = bounds.clip(covered.get_rect())
+            if not bounds:
+                return
+
+        silhouette = pygame.Surface(bounds.size, pygame.SRCALPHA)
+        for points in polygons:
+            pygame.draw.polygon(silhouette, OUTLINE_COLOR, [(x - bounds.x, y - bounds.y) for x, y in points])
+        if covered is not None:
+            mask = pygame.mask.from_surface(silhouette)
+            mask.erase(pygame.mask.from_surface(covered.subsurface(bounds)), (0, 0))
+            silhouette = mask.to_surface(setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0))
+        for shift in OUTLINE_OFFSETS:
+            surf.blit(silhouette, (bounds.x + shift[0], bounds.y + shift[1]))
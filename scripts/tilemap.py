@@ -2,6 +2,9 @@ import json
 
 import pygame
 
+from scripts.mapfile import MapFile, save_map
+from scripts.outline import make_outline, patch_outline
+
 AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1)])): 0,
     tuple(sorted([(1, 0), (0, 1), (-1, 0)])): 1,
@@ -26,6 +29,20 @@ AUTOTILE_MAP_BORDER = {
     tuple(sorted([(1, 0), (-1, 0), (0, -1), (0, 1)])): 4,
 }
 
+# Bit i of an autotile mask is set when the neighbor at AUTOTILE_SHIFTS[i] holds the same tile type
+AUTOTILE_SHIFTS = [(1, 0), (-1, 0), (0, -1), (0, 1)]
+
+
+def autotile_table(autotile_map):
+    table = [None] * (1 << len(AUTOTILE_SHIFTS))
+    for neighbors, variant in autotile_map.items():
+        table[sum(1 << AUTOTILE_SHIFTS.index(shift) for shift in neighbors)] = variant
+    return table
+
+
+AUTOTILE_TABLE = autotile_table(AUTOTILE_MAP)
+AUTOTILE_TABLE_BORDER = autotile_table(AUTOTILE_MAP_BORDER)
+
 NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, 1), (1, -1), (1, 0), (0, 0), (-1, 1), (0, 1), (1, 1)]
 PHYSICS_TILES = {'egypt_wood', 'brick', 'stone_border', 'egypt_border', 'barrier', 'egypt_platform'}
 DEATH_TILES = {'traps'}
@@ -42,6 +59,36 @@ RAT_TILES = {'Rat'}
 AUTOTILE_BORDERS = {'stone_border', 'egypt_border'}
 PLATFORM_TILES = {'platform'}
 
+CHUNK_SIZE = 16
+OUTLINE_PATCH_LIMIT = 64
+OFFGRID_BUCKET_SIZE = 256
+
+RECT_CATEGORIES = {
+    'physics': PHYSICS_TILES,
+    'platform': PLATFORM_TILES,
+    'death': DEATH_TILES,
+    'chest': CHEST_TILES,
+    'key': KEY_TILES,
+    'lever': LEVER_TILES,
+    'button': BUTTON_TILES,
+    'door': DOOR_TILES,
+}
+TILE_CATEGORIES = {tile_type: category for category, types in RECT_CATEGORIES.items() for tile_type in types}
+
+
+class Tile:
+    __slots__ = ('type', 'variant', 'pos')
+
+    def __init__(self, tile_type, variant, pos):
+        self.type = tile_type
+        self.variant = variant
+        self.pos = list(pos)
+
+    def copy(self):
+        return Tile(self.type, self.variant, self.pos)
+
+    def to_dict(self):
+        return {'type': self.type, 'variant': self.variant, 'pos': self.pos}
 
 
 class Tilemap:
@@ -50,229 +97,503 @@ class Tilemap:
         self.tile_size = tile_size
         self.tilemap = {}
         self.offgrid_tiles = []
+        self.offgrid_buckets = None
+        self.offgrid_count = 0
+        self.type_index = {}
+        self.rect_cache = {}
+        self.around_cache = {}
+        self.chunks = {}
+        self.chunk_outlines = {}
+        self.outline_changes = {}
+        self.redraw = True
+        self.map_file = None
+        self.pending = {}
+        self.pending_size = CHUNK_SIZE
 
     def extract(self, id_pairs, keep=False):
         matches = []
         for tile in self.offgrid_tiles.copy():
-            if (tile['type'], tile['variant']) in id_pairs:
+            if (tile.type, tile.variant) in id_pairs:
                 matches.append(tile.copy())
                 if not keep:
                     self.offgrid_tiles.remove(tile)
+                    self.offgrid_buckets = None
 
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            if (tile['type'], tile['variant']) in id_pairs:
+        for loc, tile in self.locate_tiles({tile_type for tile_type, variant in id_pairs}):
+            if (tile.type, tile.variant) in id_pairs:
                 matches.append(tile.copy())
-                matches[-1]['pos'] = matches[-1]['pos'].copy()
-                matches[-1]['pos'][0] *= self.tile_size
-                matches[-1]['pos'][1] *= self.tile_size
+                matches[-1].pos[0] *= self.tile_size
+                matches[-1].pos[1] *= self.tile_size
                 if not keep:
-                    del self.tilemap[loc]
+                    self.remove_tile(loc)
 
         return matches
 
-    def tiles_around(self, pos):
-        tiles = []
-        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+    def locate_around(self, pos):
+        matches = []
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
+        self.load_area(tile_x - 1, tile_y - 1, tile_x + 1, tile_y + 1)
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
+            check_loc = (tile_x + offset[0], tile_y + offset[1])
             if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
-        return tiles
+                matches.append((check_loc, self.tilemap[check_loc]))
+        return matches
+
+    def tiles_around(self, pos):
+        return [tile for loc, tile in self.locate_around(pos)]
+
+    def locate_tiles(self, tiletype):
+        for chunk, chunk_types in list(self.pending.items()):
+            if not chunk_types.isdisjoint(tiletype):
+                self.load_chunk(chunk)
+        matches = []
+        for tile_type in tiletype:
+            if tile_type in self.type_index:
+                matches.extend(self.type_index[tile_type].items())
+        return matches
 
     def check_tile(self, tiletype):
-        tiles = []
-        for loc in self.tilemap:
-            for types in tiletype:
-                if self.tilemap[loc]['type'] == types:
-                    tiles.append(self.tilemap[loc])
-        return tiles
+        return [tile for loc, tile in self.locate_tiles(tiletype)]
+
+    def put_tile(self, loc, tile_type, variant):
+        # Stores the tile without invalidating any cache; returns None if the cell already holds that exact tile
+        self.load_cell(loc)
+        old = self.tilemap.get(loc)
+        if old is not None:
+            if old.type == tile_type and old.variant == variant:
+                return None
+            del self.type_index[old.type][loc]
+        tile = Tile(tile_type, variant, loc)
+        self.tilemap[loc] = tile
+        self.type_index.setdefault(tile_type, {})[loc] = tile
+        return tile
+
+    def pop_tile(self, loc):
+        self.load_cell(loc)
+        tile = self.tilemap.pop(loc, None)
+        if tile is not None:
+            del self.type_index[tile.type][loc]
+        return tile
+
+    def set_tile(self, loc, tile_type, variant):
+        tile = self.put_tile(loc, tile_type, variant)
+        if tile is None:
+            return self.tilemap[loc]
+        self.invalidate(loc)
+        return tile
+
+    def remove_tile(self, loc):
+        tile = self.pop_tile(loc)
+        if tile is not None:
+            self.invalidate(loc)
+        return tile
+
+    def paint(self, locs, tile_type, variant):
+        changed = [loc for loc in locs if self.put_tile(loc, tile_type, variant) is not None]
+        self.invalidate_cells(changed)
+        return changed
+
+    def erase(self, locs):
+        changed = [loc for loc in locs if self.pop_tile(loc) is not None]
+        self.invalidate_cells(changed)
+        return changed
+
+    def set_tile_type(self, loc, tile_type):
+        tile = self.tilemap[loc]
+        del self.type_index[tile.type][loc]
+        tile.type = tile_type
+        self.type_index.setdefault(tile_type, {})[loc] = tile
+        self.invalidate(loc)
+
+    def set_tile_variant(self, loc, variant):
+        self.tilemap[loc].variant = variant
+        self.invalidate(loc)
 
     def save(self, path):
+        self.load_all()
+        if path.endswith('.wwm'):
+            save_map(path, self.tile_size, CHUNK_SIZE,
+                     {loc: (tile.type, tile.variant) for loc, tile in self.tilemap.items()},
+                     [(tile.type, tile.variant, tile.pos[0], tile.pos[1]) for tile in self.offgrid_tiles])
+            return
+
+        tilemap = {str(loc[0]) + ';' + str(loc[1]): tile.to_dict() for loc, tile in self.tilemap.items()}
+        offgrid = [tile.to_dict() for tile in self.offgrid_tiles]
         f = open(path, 'w')
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles}, f)
+        json.dump({'tilemap': tilemap, 'tile_size': self.tile_size, 'offgrid': offgrid}, f)
         f.close()
 
     def load(self, path):
-        f = open(path, 'r')
-        map_data = json.load(f)
-
-        self.tilemap = map_data['tilemap']
-        self.tile_size = map_data['tile_size']
-        self.offgrid_tiles = map_data['offgrid']
+        self.close_map_file()
+        self.tilemap = {}
+        self.type_index = {}
+        self.pending = {}
+
+        if path.endswith('.wwm'):
+            # Grid chunks stay in the mapped file until something needs them
+            self.map_file = MapFile(path)
+            self.tile_size = self.map_file.tile_size
+            self.pending = {chunk: chunk_types for chunk, (chunk_types, offset) in self.map_file.chunks.items()}
+            self.pending_size = self.map_file.chunk_size
+            self.offgrid_tiles = [Tile(tile_type, variant, (x, y))
+                                  for tile_type, variant, x, y in self.map_file.offgrid]
+            if not self.pending:
+                self.close_map_file()
+        else:
+            f = open(path, 'r')
+            map_data = json.load(f)
+            f.close()
+
+            for loc, tile_data in map_data['tilemap'].items():
+                x, y = loc.split(';')
+                loc = (int(x), int(y))
+                tile = Tile(tile_data['type'], tile_data['variant'], tile_data['pos'])
+                self.tilemap[loc] = tile
+                self.type_index.setdefault(tile.type, {})[loc] = tile
+            self.tile_size = map_data['tile_size']
+            self.offgrid_tiles = [Tile(tile['type'], tile['variant'], tile['pos']) for tile in map_data['offgrid']]
+        self.offgrid_buckets = None
+        self.invalidate()
+
+    def close_map_file(self):
+        if self.map_file:
+            self.map_file.close()
+            self.map_file = None
+
+    def load_chunk(self, chunk):
+        if chunk in self.pending:
+            del self.pending[chunk]
+            for loc, tile_type, variant in self.map_file.decode_chunk(chunk):
+                tile = Tile(tile_type, variant, loc)
+                self.tilemap[loc] = tile
+                self.type_index.setdefault(tile_type, {})[loc] = tile
+            if not self.pending:
+                self.close_map_file()
+
+    def load_cell(self, loc):
+        if self.pending:
+            self.load_chunk((loc[0] // self.pending_size, loc[1] // self.pending_size))
+
+    def load_area(self, left, top, right, bottom):
+        if self.pending:
+            for cx in range(left // self.pending_size, right // self.pending_size + 1):
+                for cy in range(top // self.pending_size, bottom // self.pending_size + 1):
+                    self.load_chunk((cx, cy))
+
+    def load_all(self):
+        for chunk in list(self.pending):
+            self.load_chunk(chunk)
 
     def solid_check(self, pos):
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        self.load_cell(tile_loc)
         if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
+            if self.tilemap[tile_loc].type in PHYSICS_TILES:
                 return self.tilemap[tile_loc]
 
     def solid_check_platform(self, pos):
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        self.load_cell(tile_loc)
         if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PLATFORM_TILES:
+            if self.tilemap[tile_loc].type in PLATFORM_TILES:
                 return self.tilemap[tile_loc]
 
-    def physics_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
-        return rects
-    
-    def platform_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PLATFORM_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size - 43))
-        return rects
-
-    def chest_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in CHEST_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
-        return rects
-
-    def button_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in BUTTON_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
-        return rects
-
-    def lever_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in LEVER_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
-        return rects
-
-    def key_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in KEY_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
-        return rects
-
-    def door_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in DOOR_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
-        return rects
-
-    def death_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):  # collision with traps
-            if tile['type'] in DEATH_TILES:
-                if tile['variant'] == 0 or tile['variant'] == 4:  # collision traps down
-                    rects.append(
-                        pygame.Rect(tile['pos'][0] * self.tile_size,
-                                    (tile['pos'][1] * (self.tile_size)) + self.tile_size // 1.5,
-                                    self.tile_size, self.tile_size // 3))
-                elif tile['variant'] == 2 or tile['variant'] == 6:  # collision traps up
-                    rects.append(
-                        pygame.Rect(tile['pos'][0] * self.tile_size,
-                                    (tile['pos'][1] * (self.tile_size)),
-                                    self.tile_size, self.tile_size // 3))
-                elif tile['variant'] == 3 or tile['variant'] == 7:  # collision traps up
-                    rects.append(
-                        pygame.Rect(tile['pos'][0] * self.tile_size,
-                                    (tile['pos'][1] * (self.tile_size)),
-                                    self.tile_size // 3, self.tile_size))
-                elif tile['variant'] == 1 or tile['variant'] == 5:  # collision traps up
-                    rects.append(
-                        pygame.Rect((tile['pos'][0] * self.tile_size) + self.tile_size // 1.5,
-                                    (tile['pos'][1] * (self.tile_size)),
-                                    self.tile_size // 3, self.tile_size))
-        return rects
+    def tile_rect(self, tile):
+        category = TILE_CATEGORIES.get(tile.type)
+        x = tile.pos[0] * self.tile_size
+        y = tile.pos[1] * self.tile_size
+        if category == 'platform':
+            return category, pygame.Rect(x, y, self.tile_size, self.tile_size - 43)
+        if category == 'death':  # collision with traps
+            if tile.variant == 0 or tile.variant == 4:  # collision traps down
+                return category, pygame.Rect(x, y + self.tile_size // 1.5, self.tile_size, self.tile_size // 3)
+            elif tile.variant == 2 or tile.variant == 6:  # collision traps up
+                return category, pygame.Rect(x, y, self.tile_size, self.tile_size // 3)
+            elif tile.variant == 3 or tile.variant == 7:  # collision traps up
+                return category, pygame.Rect(x, y, self.tile_size // 3, self.tile_size)
+            elif tile.variant == 1 or tile.variant == 5:  # collision traps up
+                return category, pygame.Rect(x + self.tile_size // 1.5, y, self.tile_size // 3, self.tile_size)
+            return None, None
+        if category:
+            return category, pygame.Rect(x, y, self.tile_size, self.tile_size)
+        return None, None
+
+    def rects_around(self, pos):
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        if tile_loc in self.around_cache:
+            return self.around_cache[tile_loc]
+
+        self.load_area(tile_loc[0] - 1, tile_loc[1] - 1, tile_loc[0] + 1, tile_loc[1] + 1)
+        buckets = {}
+        for offset in NEIGHBOR_OFFSETS:
+            check_loc = (tile_loc[0] + offset[0], tile_loc[1] + offset[1])
+            if check_loc in self.tilemap:
+                if check_loc not in self.rect_cache:
+                    self.rect_cache[check_loc] = self.tile_rect(self.tilemap[check_loc])
+                category, rect = self.rect_cache[check_loc]
+                if category:
+                    buckets.setdefault(category, []).append(rect)
+
+        around = {category: tuple(rects) for category, rects in buckets.items()}
+        self.around_cache[tile_loc] = around
+        return around
+
+    def invalidate(self, loc=None):
+        if loc is None:
+            self.redraw = True
+            self.rect_cache = {}
+            self.around_cache = {}
+            self.chunks = {}
+            self.chunk_outlines = {}
+            self.outline_changes = {}
+        else:
+            self.invalidate_cells([loc])
+
+    def invalidate_cells(self, locs):
+        # Every cell drops its rect caches, but each chunk touched by a stroke is only dropped once.
+        # Chunk outlines are kept and only the changed cells are redone the next time they are drawn
+        chunks = set()
+        for loc in locs:
+            self.rect_cache.pop(loc, None)
+            for offset in NEIGHBOR_OFFSETS:
+                self.around_cache.pop((loc[0] - offset[0], loc[1] - offset[1]), None)
+            chunk = (loc[0] // CHUNK_SIZE, loc[1] // CHUNK_SIZE)
+            chunks.add(chunk)
+            if chunk in self.chunk_outlines:
+                self.outline_changes.setdefault(chunk, set()).add(loc)
+        for chunk in chunks:
+            self.chunks.pop(chunk, None)
+        if chunks:
+            self.redraw = True
 
     def chest_state(self, pos):
         if self.game.chest:
             self.key_enable()
-            for tile in self.tiles_around(pos):
-                if tile['type'] in CHEST_TILES:
-                    tile['variant'] = 1
+            for loc, tile in self.locate_around(pos):
+                if tile.type in CHEST_TILES:
+                    self.set_tile_variant(loc, 1)
 
     def button_state(self, pos):
         if self.game.button:
-            for tile in self.tiles_around(pos):
-                if tile['type'] in BUTTON_TILES:
-                    tile['variant'] = 1
+            for loc, tile in self.locate_around(pos):
+                if tile.type in BUTTON_TILES:
+                    self.set_tile_variant(loc, 1)
             self.barrier_remove()
 
     def lever_state(self, pos):
         if self.game.lever:
-            for tile in self.tiles_around(pos):
-                if tile['type'] in LEVER_TILES:
-                    tile['variant'] = 0
+            for loc, tile in self.locate_around(pos):
+                if tile.type in LEVER_TILES:
+                    self.set_tile_variant(loc, 0)
             self.plat_move()
 
     def barrier_remove(self):
-        for tile in self.check_tile(BARRIER_TILES):
-            tile['pos'][0] = 64
+        for loc, tile in self.locate_tiles(BARRIER_TILES):
+            tile.pos[0] = 64
+            self.invalidate(loc)
 
     def plat_move(self):
         if not self.game.platform_has_moved:
-            for tile in self.check_tile(MOVING_TILES):
-                tile['pos'][1] = 64
-            for dest in self.check_tile(DEST_TILES):
-                dest['type'] = 'egypt_platform'
+            for loc, tile in self.locate_tiles(MOVING_TILES):
+                tile.pos[1] = 64
+                self.invalidate(loc)
+            for loc, dest in self.locate_tiles(DEST_TILES):
+                self.set_tile_type(loc, 'egypt_platform')
             self.game.platform_has_moved = True
 
     def key_enable(self):
-        for tile in self.check_tile(KEY_TILES):
-            if tile['variant'] == 0:
-                tile['variant'] = 1
+        for loc, tile in self.locate_tiles(KEY_TILES):
+            if tile.variant == 0:
+                self.set_tile_variant(loc, 1)
                 self.game.key_state = 1
 
     def key_disable(self):
-        for tile in self.check_tile(KEY_TILES):
-            if tile['variant'] == 1:
-                tile['variant'] = 0
+        for loc, tile in self.locate_tiles(KEY_TILES):
+            if tile.variant == 1:
+                self.set_tile_variant(loc, 0)
                 self.game.key_state = 2
 
-    def autotile(self):
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
-            elif (tile['type'] in AUTOTILE_BORDERS) and (neighbors in AUTOTILE_MAP_BORDER):
-                tile['variant'] = AUTOTILE_MAP_BORDER[neighbors]
-
-    def render(self, surf, offset=(0, 0)):
-        for tile in self.offgrid_tiles:
-            surf.blit(self.game.assets[tile['type']][tile['variant']],
-                      (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
+    def autotile_variant(self, loc):
+        tile = self.tilemap[loc]
+        if tile.type in AUTOTILE_TYPES:
+            table = AUTOTILE_TABLE
+        elif tile.type in AUTOTILE_BORDERS:
+            table = AUTOTILE_TABLE_BORDER
+        else:
+            return None
+        mask = 0
+        for bit, shift in enumerate(AUTOTILE_SHIFTS):
+            neighbor = self.tilemap.get((loc[0] + shift[0], loc[1] + shift[1]))
+            if neighbor is not None and neighbor.type == tile.type:
+                mask |= 1 << bit
+        return table[mask]
+
+    def autotile_at(self, loc):
+        # Only the cell and its 4-neighborhood can change when a single cell is edited
+        self.load_area(loc[0] - 2, loc[1] - 2, loc[0] + 2, loc[1] + 2)
+        for shift in [(0, 0)] + AUTOTILE_SHIFTS:
+            check_loc = (loc[0] + shift[0], loc[1] + shift[1])
+            if check_loc in self.tilemap:
+                variant = self.autotile_variant(check_loc)
+                if variant is not None and variant != self.tilemap[check_loc].variant:
+                    self.set_tile_variant(check_loc, variant)
 
-        for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                loc = str(x) + ';' + str(y)
+    def autotile(self):
+        self.load_all()
+        for loc, tile in self.tilemap.items():
+            variant = self.autotile_variant(loc)
+            if variant is not None:
+                tile.variant = variant
+        self.invalidate()
+
+    def offgrid_index(self):
+        # Built lazily so that offgrid tiles without an image (e.g. spawners in game) can be extracted first
+        if self.offgrid_buckets is None:
+            self.offgrid_buckets = {}
+            self.offgrid_count = 0
+            for tile in self.offgrid_tiles:
+                self.bucket_offgrid(tile)
+        return self.offgrid_buckets
+
+    def offgrid_bucket_range(self, rect):
+        for bx in range(rect.left // OFFGRID_BUCKET_SIZE, (rect.right - 1) // OFFGRID_BUCKET_SIZE + 1):
+            for by in range(rect.top // OFFGRID_BUCKET_SIZE, (rect.bottom - 1) // OFFGRID_BUCKET_SIZE + 1):
+                yield bx, by
+
+    def offgrid_rect(self, tile):
+        img = self.game.assets[tile.type][tile.variant]
+        return pygame.Rect(tile.pos[0], tile.pos[1], img.get_width(), img.get_height())
+
+    def bucket_offgrid(self, tile):
+        rect = self.offgrid_rect(tile)
+        entry = (self.offgrid_count, tile, rect)
+        self.offgrid_count += 1
+        for bucket in self.offgrid_bucket_range(rect):
+            self.offgrid_buckets.setdefault(bucket, []).append(entry)
+
+    def add_offgrid(self, tile):
+        self.offgrid_tiles.append(tile)
+        if self.offgrid_buckets is not None:
+            self.bucket_offgrid(tile)
+
+    def remove_offgrid(self, tile):
+        self.offgrid_tiles.remove(tile)
+        if self.offgrid_buckets is not None:
+            for bucket in self.offgrid_bucket_range(self.offgrid_rect(tile)):
+                entries = self.offgrid_buckets[bucket]
+                entries[:] = [entry for entry in entries if entry[1] is not tile]
+
+    def offgrid_in_rect(self, rect):
+        buckets = self.offgrid_index()
+        entries = {}
+        for bucket in self.offgrid_bucket_range(rect):
+            for entry in buckets.get(bucket, ()):
+                if entry[2].colliderect(rect):
+                    entries[entry[0]] = entry[1]
+        return [entries[seq] for seq in sorted(entries)]
+
+    def offgrid_at(self, pos):
+        bucket = (int(pos[0] // OFFGRID_BUCKET_SIZE), int(pos[1] // OFFGRID_BUCKET_SIZE))
+        return [entry[1] for entry in self.offgrid_index().get(bucket, ()) if entry[2].collidepoint(pos)]
+
+    def render_chunk(self, chunk):
+        # Tiles that were moved off their cell or overflow it are drawn every frame instead of being baked
+        chunk_surf = None
+        overflow = []
+        blits = []
+        atlas = self.game.atlas
+        chunk_px = CHUNK_SIZE * self.tile_size
+        self.load_area(chunk[0] * CHUNK_SIZE, chunk[1] * CHUNK_SIZE,
+                       (chunk[0] + 1) * CHUNK_SIZE - 1, (chunk[1] + 1) * CHUNK_SIZE - 1)
+        for x in range(chunk[0] * CHUNK_SIZE, (chunk[0] + 1) * CHUNK_SIZE):
+            for y in range(chunk[1] * CHUNK_SIZE, (chunk[1] + 1) * CHUNK_SIZE):
+                loc = (x, y)
                 if loc in self.tilemap:
                     tile = self.tilemap[loc]
-                    surf.blit(self.game.assets[tile['type']][tile['variant']],
+                    img = self.game.assets[tile.type][tile.variant]
+                    if tuple(tile.pos) != loc or max(img.get_size()) > self.tile_size:
+                        overflow.append(tile)
+                        continue
+                    blits.append(atlas.blit_args(img, (x * self.tile_size - chunk[0] * chunk_px,
+                                                       y * self.tile_size - chunk[1] * chunk_px)))
+        if blits:
+            # Colorkeyed like the tile images themselves; per-pixel alpha would make every chunk blit much slower
+            chunk_surf = pygame.Surface((chunk_px, chunk_px)).convert()
+            chunk_surf.fill((0, 0, 0))
+            chunk_surf.set_colorkey((0, 0, 0))
+            chunk_surf.blits(blits, doreturn=False)
+        return chunk_surf, overflow
+
+    def render(self, surf, offset=(0, 0)):
+        # Decode binary map chunks one chunk ahead of the view so they are ready before they scroll in
+        view_left = offset[0] // self.tile_size - CHUNK_SIZE
+        view_top = offset[1] // self.tile_size - CHUNK_SIZE
+        self.load_area(view_left, view_top, view_left + surf.get_width() // self.tile_size + 2 * CHUNK_SIZE,
+                       view_top + surf.get_height() // self.tile_size + 2 * CHUNK_SIZE)
+
+        # The whole layer goes out in one blits call, in the same order as drawing tile by tile
+        atlas = self.game.atlas
+        blits = []
+        for tile in self.offgrid_in_rect(pygame.Rect(offset, surf.get_size())):
+            blits.append(atlas.blit_args(self.game.assets[tile.type][tile.variant],
+                                         (tile.pos[0] - offset[0], tile.pos[1] - offset[1])))
+
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for cx in range(offset[0] // chunk_px, (offset[0] + surf.get_width()) // chunk_px + 1):
+            for cy in range(offset[1] // chunk_px, (offset[1] + surf.get_height()) // chunk_px + 1):
+                chunk = (cx, cy)
+                if chunk not in self.chunks:
+                    self.chunks[chunk] = self.render_chunk(chunk)
+                chunk_surf, overflow = self.chunks[chunk]
+                if chunk_surf is not None:
+                    blits.append((chunk_surf, (cx * chunk_px - offset[0], cy * chunk_px - offset[1])))
+                for tile in overflow:
+                    blits.append(atlas.blit_args(self.game.assets[tile.type][tile.variant],
+                                                 (tile.pos[0] * self.tile_size - offset[0],
+                                                  tile.pos[1] * self.tile_size - offset[1])))
+        surf.blits(blits, doreturn=False)
+
+    def prerender(self, rect):
+        # Builds the chunk surfaces and outlines covering rect ahead of its first frame, e.g. on the preloader thread
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for cx in range(rect.left // chunk_px, rect.right // chunk_px + 1):
+            for cy in range(rect.top // chunk_px, rect.bottom // chunk_px + 1):
+                chunk = (cx, cy)
+                if chunk not in self.chunks:
+                    self.chunks[chunk] = self.render_chunk(chunk)
+                chunk_surf = self.chunks[chunk][0]
+                if chunk_surf is not None and chunk not in self.chunk_outlines:
+                    self.chunk_outlines[chunk] = make_outline(chunk_surf)
+
+    def render_outline(self, surf, offset=(0, 0)):
+        for tile in self.offgrid_in_rect(pygame.Rect(offset, surf.get_size())):
+            surf.blit(self.game.outlines.get(self.game.assets[tile.type][tile.variant]),
+                      (tile.pos[0] - offset[0] - 1, tile.pos[1] - offset[1] - 1))
+
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for cx in range(offset[0] // chunk_px, (offset[0] + surf.get_width()) // chunk_px + 1):
+            for cy in range(offset[1] // chunk_px, (offset[1] + surf.get_height()) // chunk_px + 1):
+                chunk = (cx, cy)
+                if chunk not in self.chunks:
+                    self.chunks[chunk] = self.render_chunk(chunk)
+                chunk_surf, overflow = self.chunks[chunk]
+                changes = self.outline_changes.pop(chunk, ())
+                if chunk_surf is None:
+                    self.chunk_outlines.pop(chunk, None)
+                elif chunk not in self.chunk_outlines or len(changes) > OUTLINE_PATCH_LIMIT:
+                    self.chunk_outlines[chunk] = make_outline(chunk_surf)
+                else:
+                    for loc in changes:
+                        patch_outline(self.chunk_outlines[chunk], chunk_surf,
+                                      pygame.Rect((loc[0] - chunk[0] * CHUNK_SIZE) * self.tile_size,
+                                                  (loc[1] - chunk[1] * CHUNK_SIZE) * self.tile_size,
+                                                  self.tile_size, self.tile_size))
+                if chunk_surf is not None:
+                    surf.blit(self.chunk_outlines[chunk],
+                              (cx * chunk_px - offset[0] - 1, cy * chunk_px - offset[1] - 1))
+                for tile in overflow:
+                    surf.blit(self.game.outlines.get(self.game.assets[tile.type][tile.variant]),
                               (
-                                  tile['pos'][0] * self.tile_size - offset[0],
-                                  tile['pos'][1] * self.tile_size - offset[1]))
+                                  tile.pos[0] * self.tile_size - offset[0] - 1,
+                                  tile.pos[1] * self.tile_size - offset[1] - 1))
@@ -1,8 +1,12 @@
+import functools
 import os
 
 import pygame
 
 BASE_IMG_PATH = 'data/images/'
+FONT_PATH = 'data/font.ttf'
+FONT_CACHE_SIZE = 32
+TEXT_CACHE_SIZE = 256
 
 
 def load_image(path):
@@ -18,28 +22,84 @@ def load_images(path):
     return images
 
 
-def get_font(size):
-    return pygame.font.Font("data/font.ttf", size)
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(path, size):
+    return pygame.font.Font(path, size)
+
+
+def get_font(size, path=FONT_PATH):
+    return load_font(path, size)
+
+
+@functools.lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_cached_text(font, text, antialias, color):
+    return font.render(text, antialias, color)
+
+
+def render_text(font, text, antialias, color):
+    # Same arguments as Font.render; the returned surface is shared, so callers must not draw on it
+    return render_cached_text(font, text, antialias, tuple(pygame.Color(color)))
+
+
+def line_cells(start, end):
+    # Bresenham's line: every grid cell from start to end inclusive, so a fast drag doesn't skip cells
+    x, y = start
+    dx = abs(end[0] - x)
+    dy = -abs(end[1] - y)
+    step_x = 1 if x < end[0] else -1
+    step_y = 1 if y < end[1] else -1
+    error = dx + dy
+    cells = [(x, y)]
+    while (x, y) != (end[0], end[1]):
+        double = 2 * error
+        if double >= dy:
+            error += dy
+            x += step_x
+        if double <= dx:
+            error += dx
+            y += step_y
+        cells.append((x, y))
+    return cells
 
 
 class Animation:
+    # Clip data shared by every entity playing it; the per-entity position lives in a Playhead
+    __slots__ = ('images', 'flipped_images', 'img_duration', 'loop', 'length')
+
     def __init__(self, images, img_dur=5, loop=True):
         self.images = images
-        self.loop = loop
+        self.flipped_images = [pygame.transform.flip(img, True, False) for img in images]
         self.img_duration = img_dur
+        self.loop = loop
+        self.length = img_dur * len(images)
+
+    def img(self, frame, flip=False):
+        if flip:
+            return self.flipped_images[int(frame / self.img_duration)]
+        return self.images[int(frame / self.img_duration)]
+
+
+class Playhead:
+    __slots__ = ('animation', 'frame', 'done')
+
+    def __init__(self, animation, frame=0):
+        self.animation = animation
+        self.frame = frame
         self.done = False
-        self.frame = 0
 
-    def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+    def reset(self, animation, frame=0):
+        self.animation = animation
+        self.frame = frame
+        self.done = False
 
     def update(self):
-        if self.loop:
-            self.frame = (self.frame + 1) % (self.img_duration * len(self.images))
+        length = self.animation.length
+        if self.animation.loop:
+            self.frame = (self.frame + 1) % length
         else:
-            self.frame = min(self.frame + 1, self.img_duration * len(self.images) - 1)
-            if self.frame >= self.img_duration * len(self.images) - 1:
+            self.frame = min(self.frame + 1, length - 1)
+            if self.frame >= length - 1:
                 self.done = True
 
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
+    def img(self, flip=False):
+        return self.animation.img(self.frame, flip)